@@ -1,26 +1,108 @@
 import streamlit as st
-import google.generativeai as genai
-import requests
-import json
+import asyncio
+import hashlib
+import textwrap
 import os
+import re
 from datetime import datetime
 
+# Number of recent user/model exchanges sent to Gemini as context
+MAX_HISTORY_TURNS = 8
+
+# Maximum number of separate searches issued for a single prompt
+MAX_SEARCH_QUERIES = 3
+
+# Words that mark a question as a follow-up rather than a standalone search
+FOLLOW_UP_OPENERS = {"and", "or", "but", "also", "so", "then"}
+FOLLOW_UP_PRONOUNS = {"it", "its", "they", "them", "their", "this", "these", "those"}
+
+# Longest search snippet kept in the prompt
+MAX_SNIPPET_CHARS = 200
+
+# Maximum number of questions answered from one imported file
+MAX_BATCH_QUESTIONS = 20
+
+# Maximum number of bulk questions sent to Gemini at the same time
+MAX_BATCH_CONCURRENCY = 4
+
+# Maximum number of messages kept in the transcript
+MAX_MESSAGES = 200
+
+# Number of most recent messages rendered on every rerun
+MAX_RENDERED_MESSAGES = 50
+
+# Prompts shorter than this are not sent to the model
+MIN_PROMPT_CHARS = 3
+
+# Canned replies for small talk that doesn't need the model
+CANNED_RESPONSES = {
+    "hi": "Hello! What health question can I help you with today?",
+    "hello": "Hello! What health question can I help you with today?",
+    "hey": "Hello! What health question can I help you with today?",
+    "good morning": "Good morning! What health question can I help you with today?",
+    "good evening": "Good evening! What health question can I help you with today?",
+    "thanks": "You're welcome! Let me know if you have any other health questions.",
+    "thank you": "You're welcome! Let me know if you have any other health questions.",
+    "thx": "You're welcome! Let me know if you have any other health questions.",
+    "bye": "Take care! Remember to consult a healthcare professional for any medical concerns.",
+    "goodbye": "Take care! Remember to consult a healthcare professional for any medical concerns.",
+}
+
+# Medical context for the AI
+MEDICAL_CONTEXT = """
+You are MediAssist, a helpful and compassionate medical AI assistant. Your purpose is to provide
+information about medical conditions, treatments, and general health advice.
+"""
+
+# Prompt with search results and medical context
+SEARCH_PROMPT_TEMPLATE = MEDICAL_CONTEXT + """
+The user query is: {prompt}
+
+Here are relevant medical search results from the web:
+{search_context}
+
+Please provide a helpful response based on these search results and your knowledge.
+If the search results are relevant, incorporate that information.
+Always cite the sources if you use information from the search results.
+Remember to follow the medical guidelines provided above.
+"""
+
+# Standard chat prompt without search but with medical context
+CHAT_PROMPT_TEMPLATE = MEDICAL_CONTEXT + """
+The user query is: {prompt}
+
+Please provide a helpful response based on your medical knowledge.
+Remember to follow the medical guidelines provided above.
+"""
+
 # Function to initialize session state
 def initialize_session_state():
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-    if "chat_history" not in st.session_state:
-        st.session_state.chat_history = []
-    if "search_mode" not in st.session_state:
-        st.session_state.search_mode = False
-    if "gemini_api_key" not in st.session_state:
-        st.session_state.gemini_api_key = st.secrets["GEMINI_API_KEY"]
-    if "serper_api_key" not in st.session_state:
-        st.session_state.serper_api_key = st.secrets["SERPER_API_KEY"]
-
-# Function to configure Gemini API
-def configure_gemini():
-    genai.configure(api_key=st.session_state.gemini_api_key)
+    # Everything below only needs to run on the first script run of a session
+    if st.session_state.get("_initialized"):
+        return
+    
+    gemini_api_key = st.secrets["GEMINI_API_KEY"]
+    serper_api_key = st.secrets["SERPER_API_KEY"]
+    
+    st.session_state.messages = []
+    st.session_state.chat_history = []
+    st.session_state.search_mode = False
+    st.session_state.gemini_api_key = gemini_api_key
+    st.session_state.serper_api_key = serper_api_key
+    st.session_state._initialized = True
+
+# Function to add a message to the transcript, dropping the oldest beyond MAX_MESSAGES
+def add_message(role, content):
+    st.session_state.messages.append({"role": role, "content": content})
+    del st.session_state.messages[:-MAX_MESSAGES]
+
+# Function to configure Gemini API (cached so the model is built once per API key)
+@st.cache_resource
+def configure_gemini(api_key: str):
+    # Imported here so a cold start doesn't pay for the SDK until a question is asked
+    import google.generativeai as genai
+    
+    genai.configure(api_key=api_key)
     
     # Set up the model
     generation_config = {
@@ -45,105 +127,237 @@ def configure_gemini():
     
     return model
 
-# Function to perform web search using Serper API
-def search_web(query):
-    url = "https://google.serper.dev/search"
-    payload = json.dumps({
-        "q": query + " medical information",  # Add medical context to search
-        "num": 5  # Number of search results to return
-    })
-    headers = {
-        'X-API-KEY': st.session_state.serper_api_key,
-        'Content-Type': 'application/json'
+# Function to get a pooled HTTP session (cached so TLS connections survive reruns)
+@st.cache_resource
+def get_http_session():
+    # Imported here so a cold start doesn't pay for requests until a search is made
+    import requests
+    from requests.adapters import HTTPAdapter
+    
+    session = requests.Session()
+    session.headers.update({'Content-Type': 'application/json'})
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+# Function to build the Serper request body for a query
+def build_serper_payload(query, num=5):
+    # Normalize case and whitespace so trivially different queries share a cache entry
+    query = " ".join(query.lower().split())
+    return {
+        "q": f"{query} medical information",  # Add medical context to search
+        "num": num  # Number of search results to return
     }
+
+# Function to fetch Serper results (cached on the payload so repeated questions skip the network)
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def fetch_search_results(payload, api_key):
+    url = "https://google.serper.dev/search"
+    headers = {'X-API-KEY': api_key}
     
+    # Raise on failure so errors are never cached
+    response = get_http_session().post(url, headers=headers, json=payload, timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+# Function to perform web search using Serper API
+def search_web(query, api_key, num=5):
     try:
-        response = requests.post(url, headers=headers, data=payload)
-        return response.json()
+        return fetch_search_results(build_serper_payload(query, num), api_key)
     except Exception as e:
         return {"error": str(e)}
 
-# Function to format search results for the model
-def format_search_results(results):
-    if "error" in results:
-        return f"Error performing search: {results['error']}"
-    
-    formatted_results = "Medical Search Results:\n\n"
-    
-    if "organic" in results:
-        for i, result in enumerate(results["organic"][:5], 1):
-            title = result.get("title", "No title")
-            link = result.get("link", "No link")
-            snippet = result.get("snippet", "No description")
-            formatted_results += f"{i}. {title}\n   URL: {link}\n   Description: {snippet}\n\n"
-    
-    if "answerBox" in results:
-        answer_box = results["answerBox"]
-        title = answer_box.get("title", "")
-        answer = answer_box.get("answer", "")
-        snippet = answer_box.get("snippet", "")
-        formatted_results += f"Featured Medical Answer: {title}\n{answer}\n{snippet}\n\n"
-    
-    if "knowledgeGraph" in results:
-        kg = results["knowledgeGraph"]
-        title = kg.get("title", "")
-        description = kg.get("description", "")
-        formatted_results += f"Medical Knowledge: {title}\n{description}\n\n"
-    
-    return formatted_results
-
-# Function to get response from Gemini
-def get_gemini_response(model, prompt, with_search=False, query=None):
+# Function to pick the search queries for a prompt
+def extract_search_queries(prompt):
+    # Only questions that make sense on their own are worth a separate search
+    standalone = []
+    for part in re.split(r"[?\n]+", prompt):
+        part = part.strip()
+        words = re.findall(r"[a-z']+", part.lower())
+        if len(words) < 2 or words[0] in FOLLOW_UP_OPENERS or FOLLOW_UP_PRONOUNS.intersection(words):
+            continue
+        if part.lower() not in (q.lower() for q in standalone):
+            standalone.append(part)
+    
+    # Always search the full prompt; add sub-queries only when it holds several standalone questions
+    if len(standalone) < 2:
+        return [prompt]
+    return [prompt] + standalone[:MAX_SEARCH_QUERIES - 1]
+
+# Function to run several web searches concurrently
+async def search_web_many(queries, api_key):
+    # Fewer results per query when fanning out keeps the prompt size similar
+    num = 5 if len(queries) == 1 else 3
+    return await asyncio.gather(*[
+        asyncio.to_thread(search_web, query, api_key, num) for query in queries
+    ])
+
+# Function to format (query, results) pairs compactly for the model (cached on the results themselves)
+@st.cache_data(max_entries=128, show_spinner=False)
+def format_search_results(searches):
+    lines = ["Medical Search Results:"]
+    seen_snippets = set()
+    seen_links = set()
+    
+    # Shorten a snippet, or drop it if an earlier result already said the same thing
+    def compact(text):
+        text = " ".join(text.split())
+        digest = hashlib.md5(text.lower().encode()).digest()
+        if not text or digest in seen_snippets:
+            return ""
+        seen_snippets.add(digest)
+        shortened = textwrap.shorten(text, MAX_SNIPPET_CHARS, placeholder="...")
+        # shorten() drops words longer than the width, so slice instead if nothing survived
+        if shortened == "...":
+            shortened = text[:MAX_SNIPPET_CHARS - 3] + "..."
+        return shortened
+    
+    # Join the non-empty fields of an entry as "title — text (url)"
+    def entry(title, text, link=""):
+        fields = [title, f"— {text}" if title and text else text, f"({link})" if link else ""]
+        return " ".join(field for field in fields if field)
+    
+    # Number results across all searches so citations stay unambiguous
+    index = 0
+    for query, results in searches:
+        if len(searches) > 1:
+            lines.append(f"\nResults for: {' '.join(query.split())}")
+        
+        if "error" in results:
+            lines.append(f"Error performing search: {results['error']}")
+            continue
+        
+        for result in results.get("organic", [])[:5]:
+            link = result.get("link", "")
+            if link and link in seen_links:
+                continue
+            seen_links.add(link)
+            
+            line = entry(result.get("title", ""), compact(result.get("snippet", "")), link)
+            if line:
+                index += 1
+                lines.append(f"[{index}] {line}")
+        
+        if "answerBox" in results:
+            answer_box = results["answerBox"]
+            text = compact(f"{answer_box.get('answer', '')} {answer_box.get('snippet', '')}")
+            line = entry(answer_box.get("title", ""), text, answer_box.get("link", ""))
+            if line:
+                lines.append(f"Featured answer: {line}")
+        
+        if "knowledgeGraph" in results:
+            kg = results["knowledgeGraph"]
+            line = entry(kg.get("title", ""), compact(kg.get("description", "")))
+            if line:
+                lines.append(f"Knowledge: {line}")
+    
+    return "\n".join(lines)
+
+# Function to fingerprint a prompt for duplicate detection
+def prompt_digest(prompt, with_search):
+    normalized = " ".join(prompt.lower().split())
+    return hashlib.md5(f"{with_search}:{normalized}".encode()).digest()
+
+# Function to answer a prompt without the model when possible
+def get_quick_response(prompt, with_search):
+    normalized = " ".join(prompt.lower().strip(" !.?").split())
+    if normalized in CANNED_RESPONSES:
+        return CANNED_RESPONSES[normalized]
+    
+    # Short replies like "no" or a repeated "yes" answer the assistant's own follow-up question
+    # and need the conversation context, so only the model can handle them
+    last_reply = next((message["content"] for message in reversed(st.session_state.messages)
+                       if message["role"] == "assistant"), "")
+    if last_reply.rstrip().endswith("?"):
+        return None
+    
+    if len(normalized) < MIN_PROMPT_CHARS:
+        return "Please ask a more detailed health question."
+    
+    # Repeat of the previous question: reuse its answer
+    last_qa = st.session_state.get("_last_qa")
+    if last_qa and last_qa[0] == prompt_digest(prompt, with_search):
+        return last_qa[1]
+    
+    return None
+
+# Function to stream a response from Gemini
+def get_gemini_response(chat, prompt, with_search=False, query=None):
+    response_parts = []
     try:
-        # Medical context for the AI
-        medical_context = """
-        You are MediAssist, a helpful and compassionate medical AI assistant. Your purpose is to provide
-        information about medical conditions, treatments, and general health advice. 
-        """
-        
-        # If search mode is enabled and we have a query
-        search_context = ""
+        # Run the web searches (if any) concurrently
+        search_results = None
         if with_search and query:
-            search_results = search_web(query)
-            search_context = format_search_results(search_results)
-            
-            # Prepare prompt with search results and medical context
-            full_prompt = f"""
-            {medical_context}
-            
-            The user query is: {prompt}
-            
-            Here are relevant medical search results from the web:
-            {search_context}
-            
-            Please provide a helpful response based on these search results and your knowledge. 
-            If the search results are relevant, incorporate that information. 
-            Always cite the sources if you use information from the search results.
-            Remember to follow the medical guidelines provided above.
-            """
+            queries = extract_search_queries(query)
+            results = asyncio.run(search_web_many(queries, st.session_state.serper_api_key))
+            search_results = list(zip(queries, results))
+        
+        # Fill in the prompt template for the active mode
+        if search_results is not None:
+            full_prompt = SEARCH_PROMPT_TEMPLATE.format(
+                prompt=prompt,
+                search_context=format_search_results(search_results)
+            )
         else:
-            # Standard chat mode without search but with medical context
-            full_prompt = f"""
-            {medical_context}
-            
-            The user query is: {prompt}
-            
-            Please provide a helpful response based on your medical knowledge.
-            Remember to follow the medical guidelines provided above.
-            """
+            full_prompt = CHAT_PROMPT_TEMPLATE.format(prompt=prompt)
+        
+        # Take the session out of session_state until the reply completes, so a stream that
+        # is cut off (rerun, Stop) never leaves a half-finished session behind for reuse
+        st.session_state.pop("chat", None)
         
-        # Generate response
-        chat = model.start_chat(history=st.session_state.chat_history)
-        response = chat.send_message(full_prompt)
+        # Generate response, yielding text as soon as each chunk arrives
+        response_stream = chat.send_message(full_prompt, stream=True)
         
-        # Update chat history
+        for chunk in response_stream:
+            response_parts.append(chunk.text)
+            yield chunk.text
+        
+        # Keep only the bare question in the session's history so search results don't pile up
+        history = chat.history
+        history[-2].parts[0].text = prompt
+        
+        # Slide the context window once it is full so input size stays bounded
+        if len(history) > 2 * MAX_HISTORY_TURNS:
+            chat.history = history[-2 * MAX_HISTORY_TURNS:]
+        
+        # The turn finished cleanly, so the session can be reused
+        st.session_state.chat = chat
+        
+        # Update chat history (used to rebuild the session if it is reset)
         st.session_state.chat_history.append({"role": "user", "parts": [prompt]})
-        st.session_state.chat_history.append({"role": "model", "parts": [response.text]})
+        st.session_state.chat_history.append({"role": "model", "parts": ["".join(response_parts)]})
+        del st.session_state.chat_history[:-2 * MAX_HISTORY_TURNS]
         
-        return response.text
+        # Remember this answer in case the same question is asked again
+        st.session_state._last_qa = (prompt_digest(prompt, with_search), "".join(response_parts))
     
     except Exception as e:
-        return f"An error occurred: {str(e)}"
+        # The session is not put back, so the next message rebuilds it from chat_history
+        # Keep the error on its own paragraph if part of the answer was already shown
+        separator = "\n\n" if response_parts else ""
+        yield f"{separator}An error occurred: {str(e)}"
+
+# Function to answer several independent questions concurrently
+def get_gemini_responses_batch(model, prompts):
+    async def answer_all():
+        # Cap in-flight requests so a full batch stays within the API rate limit
+        semaphore = asyncio.Semaphore(MAX_BATCH_CONCURRENCY)
+        
+        async def answer(prompt):
+            async with semaphore:
+                return await asyncio.to_thread(model.generate_content, CHAT_PROMPT_TEMPLATE.format(prompt=prompt))
+        
+        return await asyncio.gather(*[answer(prompt) for prompt in prompts], return_exceptions=True)
+    
+    answers = []
+    for response in asyncio.run(answer_all()):
+        if isinstance(response, Exception):
+            answers.append(f"An error occurred: {str(response)}")
+            continue
+        try:
+            answers.append(response.text)
+        except Exception as e:
+            answers.append(f"An error occurred: {str(e)}")
+    return answers
 
 # Main app function
 def main():
@@ -173,8 +387,27 @@ def main():
         if st.button("Clear Chat History"):
             st.session_state.messages = []
             st.session_state.chat_history = []
+            st.session_state.pop("chat", None)
+            st.session_state.pop("_last_qa", None)
             st.success("Chat history cleared!")
         
+        # Bulk questions imported from a text file
+        st.subheader("Bulk Questions")
+        questions_file = st.file_uploader("Import questions (one per line)", type=["txt"])
+        
+        if questions_file is not None and st.button("Answer Questions"):
+            questions = [line.strip() for line in questions_file.getvalue().decode("utf-8-sig", errors="replace").splitlines() if line.strip()]
+            questions = questions[:MAX_BATCH_QUESTIONS]
+            
+            with st.spinner(f"Answering {len(questions)} questions..."):
+                model = configure_gemini(st.session_state.gemini_api_key)
+                answers = get_gemini_responses_batch(model, questions)
+            
+            for question, answer in zip(questions, answers):
+                add_message("user", question)
+                add_message("assistant", answer)
+            st.success(f"Answered {len(answers)} questions!")
+        
         # Medical disclaimer
         st.markdown("---")
         st.caption("""
@@ -202,9 +435,17 @@ def main():
     # Chat container
     chat_container = st.container()
     
-    # Display chat messages
+    # Display chat messages; older ones are only rendered on request
     with chat_container:
-        for message in st.session_state.messages:
+        earlier_messages = st.session_state.messages[:-MAX_RENDERED_MESSAGES]
+        recent_messages = st.session_state.messages[-MAX_RENDERED_MESSAGES:]
+        
+        if earlier_messages and st.toggle("Show earlier messages", key="show_earlier_messages"):
+            for message in earlier_messages:
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+        
+        for message in recent_messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
     
@@ -213,11 +454,8 @@ def main():
     
     # Process user input
     if user_prompt:
-        # Configure Gemini
-        model = configure_gemini()
-        
         # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": user_prompt})
+        add_message("user", user_prompt)
         
         # Display user message
         with st.chat_message("user"):
@@ -226,20 +464,37 @@ def main():
         # Display assistant response
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
-            message_placeholder.markdown("Researching medical information...")
             
-            # Get response from Gemini (with or without search)
-            full_response = get_gemini_response(
-                model, 
-                user_prompt,
-                with_search=st.session_state.search_mode,
-                query=user_prompt if st.session_state.search_mode else None
-            )
+            # Skip the model for small talk, too-short input and repeated questions
+            quick_response = get_quick_response(user_prompt, st.session_state.search_mode)
             
+            if quick_response is not None:
+                response_stream = iter([quick_response])
+            else:
+                # Configure Gemini (reused across reruns) and keep one chat session per user session
+                if "chat" not in st.session_state:
+                    model = configure_gemini(st.session_state.gemini_api_key)
+                    st.session_state.chat = model.start_chat(history=st.session_state.chat_history)
+                
+                # Stream response from Gemini (with or without search)
+                response_stream = get_gemini_response(
+                    st.session_state.chat, 
+                    user_prompt,
+                    with_search=st.session_state.search_mode,
+                    query=user_prompt if st.session_state.search_mode else None
+                )
+            
+            # Only block on the first token; render the rest as it arrives
+            with st.spinner("Researching medical information..."):
+                full_response = next(response_stream, "")
             message_placeholder.markdown(full_response)
+            
+            for text in response_stream:
+                full_response += text
+                message_placeholder.markdown(full_response)
         
         # Add assistant response to chat history
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
+        add_message("assistant", full_response)
 
 if __name__ == "__main__":
     main()